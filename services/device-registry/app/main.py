@@ -1,6 +1,10 @@
+import asyncio
+import functools
 import time
 from typing import List
+from typing import Literal
 from typing import Optional
+from typing import Union
 
 import structlog
 from fastapi import Depends
@@ -9,6 +13,7 @@ from fastapi import HTTPException
 from fastapi import Response
 from fastapi import status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPAuthorizationCredentials
 from fastapi.security import HTTPBearer
 from prometheus_client import CONTENT_TYPE_LATEST
@@ -18,15 +23,19 @@ from prometheus_client import generate_latest
 from sqlalchemy.orm import Session
 
 from .config import settings
+from .database import SessionLocal
 from .database import engine
 from .database import get_db
 from .models import device as device_models
 from .schemas import device as device_schemas
 from .services.auth_service import AuthService
+from .services.auth_service import warmup_pwd_context
 from .services.device_service import DeviceService
+from .services.redis_service import RedisService
 
 # Database tables
-device_models.Base.metadata.create_all(bind=engine)
+if settings.create_tables:
+    device_models.Base.metadata.create_all(bind=engine)
 
 # Initialize logger
 logger = structlog.get_logger()
@@ -36,20 +45,15 @@ app = FastAPI(
     title="Device Registry Service",
     description="IoT Device Registration and Management API",
     version="1.0.0",
-)
-
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    default_response_class=ORJSONResponse,
 )
 
 # Security
 security = HTTPBearer()
 
+# Initialize services
+redis_service = RedisService()
+
 # Prometheus metrics
 REQUEST_COUNT = Counter(
     "device_registry_requests_total",
@@ -61,37 +65,141 @@ REQUEST_DURATION = Histogram(
     "device_registry_request_duration_seconds",
     "Request duration in seconds",
     ["method", "endpoint"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
 )
 
 
+# Label children are cached so the middleware skips labels() lookups
+@functools.lru_cache(maxsize=512)
+def request_counter(method: str, endpoint: str, status: int):
+    return REQUEST_COUNT.labels(method=method, endpoint=endpoint, status=status)
+
+
+@functools.lru_cache(maxsize=512)
+def request_histogram(method: str, endpoint: str):
+    return REQUEST_DURATION.labels(method=method, endpoint=endpoint)
+
+
+def bind_route_metrics():
+    """Pre-bind histogram label children for every registered route"""
+    for route in app.routes:
+        for method in getattr(route, "methods", None) or ():
+            request_histogram(method, route.path)
+
+
+def endpoint_label(scope) -> str:
+    """Label requests by route template to keep metric cardinality bounded"""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # Unrouted requests would otherwise create one series per path
+    return scope["path"] if "endpoint" in scope else "unmatched"
+
+
 @app.middleware("http")
 async def metrics_middleware(request, call_next):
-    start_time = time.time()
+    # OPTIONS requests are not metered to keep label cardinality down
+    if request.method == "OPTIONS":
+        return await call_next(request)
+
+    start_time = time.perf_counter()
     response = await call_next(request)
 
     # Record metrics
-    REQUEST_COUNT.labels(
-        method=request.method, endpoint=request.url.path, status=response.status_code
-    ).inc()
-
-    REQUEST_DURATION.labels(method=request.method, endpoint=request.url.path).observe(
-        time.time() - start_time
+    endpoint = endpoint_label(request.scope)
+    request_counter(request.method, endpoint, response.status_code).inc()
+    request_histogram(request.method, endpoint).observe(
+        time.perf_counter() - start_time
     )
 
     return response
 
 
+# CORS middleware, added last so it wraps the metrics middleware and answers
+# preflight requests before they are metered
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=settings.cors_origins,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+async def flush_last_seen():
+    """Persist device last seen timestamps buffered in Redis"""
+    last_seen = await redis_service.get_last_seen()
+    if not last_seen:
+        return
+
+    db = SessionLocal()
+    try:
+        await DeviceService(db, redis_service).flush_last_seen(last_seen)
+    finally:
+        db.close()
+
+    # Only clear the buffer once the UPDATE committed, a failed flush retries
+    await redis_service.clear_last_seen(last_seen)
+
+
+async def last_seen_flush_loop():
+    """Periodically flush buffered device last seen timestamps"""
+    while True:
+        await asyncio.sleep(settings.last_seen_flush_interval)
+        try:
+            await flush_last_seen()
+        except Exception as e:
+            logger.error("Failed to flush device last seen", error=str(e))
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Warm up shared resources on startup"""
+    logger.info("Starting Device Registry Service")
+    warmup_pwd_context()
+    bind_route_metrics()
+
+    try:
+        await redis_service.connect()
+    except Exception:
+        logger.warning("Redis unavailable, device last seen is written directly")
+        return
+
+    app.state.last_seen_flush_task = asyncio.create_task(last_seen_flush_loop())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush buffered state and release connections on shutdown"""
+    logger.info("Shutting down Device Registry Service")
+
+    flush_task = getattr(app.state, "last_seen_flush_task", None)
+    if flush_task:
+        flush_task.cancel()
+        await flush_last_seen()
+
+    await redis_service.disconnect()
+
+
 @app.get("/metrics")
 async def metrics():
     return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
+# Service dependencies, resolved at most once per request
+def get_auth_service(db: Session = Depends(get_db)) -> AuthService:
+    return AuthService(db)
+
+
+def get_device_service(db: Session = Depends(get_db)) -> DeviceService:
+    return DeviceService(db, redis_service)
+
+
 # Dependency for authentication
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db),
+    auth_service: AuthService = Depends(get_auth_service),
 ):
-    auth_service = AuthService(db)
     user = await auth_service.verify_token(credentials.credentials)
     if not user:
         raise HTTPException(
@@ -111,87 +219,131 @@ async def root():
 @app.post("/devices", response_model=device_schemas.Device, tags=["Devices"])
 async def create_device(
     device: device_schemas.DeviceCreate,
-    db: Session = Depends(get_db),
+    device_service: DeviceService = Depends(get_device_service),
     current_user: dict = Depends(get_current_user),
 ):
     """Register a new IoT device"""
-    device_service = DeviceService(db)
     logger.info(
         "Creating device", device_id=device.device_id, user_id=current_user["sub"]
     )
 
     try:
         db_device = await device_service.create_device(device, current_user["sub"])
-        return db_device
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+    await redis_service.invalidate_devices(current_user["sub"])
+    return db_device
+
 
-@app.get("/devices", response_model=List[device_schemas.Device], tags=["Devices"])
+@app.get(
+    "/devices",
+    response_model=Union[
+        List[device_schemas.Device], List[device_schemas.DeviceSummary]
+    ],
+    tags=["Devices"],
+)
 async def list_devices(
     skip: int = 0,
     limit: int = 100,
-    status: Optional[str] = None,
-    db: Session = Depends(get_db),
+    status: Optional[device_models.DeviceStatus] = None,
+    view: Literal["full", "summary"] = "full",
+    device_service: DeviceService = Depends(get_device_service),
     current_user: dict = Depends(get_current_user),
 ):
     """List all devices for the authenticated user"""
-    device_service = DeviceService(db)
+    query = f"{skip}:{limit}:{status.value if status else ''}:{view}"
+    version = await redis_service.get_device_cache_version(current_user["sub"])
+    cached = await redis_service.get_cached_device_list(
+        current_user["sub"], version, query
+    )
+    if cached:
+        return Response(content=cached, media_type="application/json")
+
+    summary = view == "summary"
     devices = await device_service.list_devices(
-        user_id=current_user["sub"], skip=skip, limit=limit, status=status
+        user_id=current_user["sub"],
+        skip=skip,
+        limit=limit,
+        status=status,
+        summary=summary,
+    )
+
+    # Validate and serialize the whole page in one pass; returning a Response
+    # skips FastAPI's per-item response_model re-validation
+    adapter = (
+        device_schemas.device_summary_list_adapter
+        if summary
+        else device_schemas.device_list_adapter
     )
-    return devices
+    body = adapter.dump_json(adapter.validate_python(devices, from_attributes=True))
+    await redis_service.cache_device_list(
+        current_user["sub"], version, query, body.decode()
+    )
+    return Response(content=body, media_type="application/json")
 
 
 @app.get("/devices/{device_id}", response_model=device_schemas.Device, tags=["Devices"])
 async def get_device(
     device_id: str,
-    db: Session = Depends(get_db),
+    device_service: DeviceService = Depends(get_device_service),
     current_user: dict = Depends(get_current_user),
 ):
     """Get device details by ID"""
-    device_service = DeviceService(db)
+    version = await redis_service.get_device_cache_version(current_user["sub"])
+    cached = await redis_service.get_cached_device(
+        current_user["sub"], version, device_id
+    )
+    if cached:
+        return Response(content=cached, media_type="application/json")
+
     device = await device_service.get_device(device_id, current_user["sub"])
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
-    return device
+
+    body = device_schemas.Device.model_validate(device).model_dump_json()
+    await redis_service.cache_device(current_user["sub"], version, device_id, body)
+    return Response(content=body, media_type="application/json")
 
 
 @app.put("/devices/{device_id}", response_model=device_schemas.Device, tags=["Devices"])
 async def update_device(
     device_id: str,
     device_update: device_schemas.DeviceUpdate,
-    db: Session = Depends(get_db),
+    device_service: DeviceService = Depends(get_device_service),
     current_user: dict = Depends(get_current_user),
 ):
     """Update device information"""
-    device_service = DeviceService(db)
     logger.info("Updating device", device_id=device_id, user_id=current_user["sub"])
 
     try:
         device = await device_service.update_device(
             device_id, device_update, current_user["sub"]
         )
-        if not device:
-            raise HTTPException(status_code=404, detail="Device not found")
-        return device
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+
+    await redis_service.invalidate_devices(current_user["sub"])
+    return device
+
 
 @app.delete("/devices/{device_id}", tags=["Devices"])
 async def delete_device(
     device_id: str,
-    db: Session = Depends(get_db),
+    device_service: DeviceService = Depends(get_device_service),
     current_user: dict = Depends(get_current_user),
 ):
     """Delete a device"""
-    device_service = DeviceService(db)
     logger.info("Deleting device", device_id=device_id, user_id=current_user["sub"])
 
     success = await device_service.delete_device(device_id, current_user["sub"])
     if not success:
         raise HTTPException(status_code=404, detail="Device not found")
+
+    await redis_service.invalidate_devices(current_user["sub"])
     return {"message": "Device deleted successfully"}
 
 
@@ -203,11 +355,9 @@ async def delete_device(
 async def authenticate_device(
     device_id: str,
     auth_data: device_schemas.DeviceAuthRequest,
-    db: Session = Depends(get_db),
+    device_service: DeviceService = Depends(get_device_service),
 ):
     """Authenticate a device and return JWT token"""
-    device_service = DeviceService(db)
-
     try:
         token = await device_service.authenticate_device(device_id, auth_data.api_key)
         return {"access_token": token, "token_type": "bearer"}
@@ -75,7 +75,9 @@ class DeviceMetrics(Base):
     metric_name = Column(String(100), nullable=False)
     metric_value = Column(String(500), nullable=False)
     unit = Column(String(20))
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    timestamp = Column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
 
     class Config:
         indexes = [
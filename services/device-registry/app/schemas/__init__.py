@@ -5,6 +5,7 @@ from .device import DeviceCreate
 from .device import DeviceList
 from .device import DeviceMetrics
 from .device import DeviceStatus
+from .device import DeviceSummary
 from .device import DeviceType
 from .device import DeviceUpdate
 from .device import HealthCheck
@@ -14,6 +15,7 @@ __all__ = [
     "DeviceCreate",
     "DeviceUpdate",
     "DeviceList",
+    "DeviceSummary",
     "DeviceAuth",
     "DeviceAuthRequest",
     "DeviceMetrics",
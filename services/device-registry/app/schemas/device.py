@@ -1,13 +1,18 @@
+import json
 from datetime import datetime
 from enum import Enum
 from typing import Any
 from typing import Dict
+from typing import List
 from typing import Optional
 from uuid import UUID
 
+from pydantic import AliasChoices
 from pydantic import BaseModel
 from pydantic import ConfigDict
 from pydantic import Field
+from pydantic import TypeAdapter
+from pydantic import field_validator
 
 
 class DeviceStatus(str, Enum):
@@ -73,6 +78,13 @@ class DeviceUpdate(BaseModel):
 class Device(DeviceBase):
     model_config = ConfigDict(from_attributes=True)
 
+    # ORM rows keep metadata as a JSON string in metadata_json, their
+    # metadata attribute is SQLAlchemy's table MetaData
+    metadata: Optional[Dict[str, Any]] = Field(
+        default={},
+        validation_alias=AliasChoices("metadata_json", "metadata"),
+        description="Additional metadata",
+    )
     id: UUID
     status: DeviceStatus
     api_key: str  # In production, this should be masked
@@ -86,6 +98,35 @@ class Device(DeviceBase):
     health_check_interval: str
     last_health_check: Optional[datetime]
 
+    @field_validator("metadata", mode="before")
+    @classmethod
+    def parse_metadata_json(cls, value: Any) -> Any:
+        """Decode metadata stored as a JSON string"""
+        if value is None:
+            return {}
+        if isinstance(value, (str, bytes)):
+            return json.loads(value or "{}")
+        return value
+
+
+class DeviceSummary(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: UUID
+    device_id: str
+    name: str
+    device_type: DeviceType
+    status: DeviceStatus
+    is_healthy: bool
+    last_seen: Optional[datetime]
+    owner_id: str
+    created_at: datetime
+    updated_at: Optional[datetime]
+
+
+device_list_adapter = TypeAdapter(List[Device])
+device_summary_list_adapter = TypeAdapter(List[DeviceSummary])
+
 
 class DeviceList(BaseModel):
     devices: list[Device]
@@ -1,4 +1,5 @@
 from .auth_service import AuthService
 from .device_service import DeviceService
+from .redis_service import RedisService
 
-__all__ = ["DeviceService", "AuthService"]
+__all__ = ["DeviceService", "AuthService", "RedisService"]
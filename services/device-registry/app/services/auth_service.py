@@ -1,5 +1,6 @@
 from datetime import datetime
 from datetime import timedelta
+from functools import lru_cache
 from typing import Any
 from typing import Dict
 from typing import Optional
@@ -13,21 +14,37 @@ from ..config import settings
 
 logger = structlog.get_logger()
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Device tokens last longer
+DEVICE_TOKEN_LIFETIME = timedelta(days=365)
+
+
+@lru_cache(maxsize=None)
+def get_pwd_context() -> CryptContext:
+    """Return the shared password hashing context"""
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def warmup_pwd_context() -> None:
+    """Load the bcrypt backend once so the first request doesn't pay for it"""
+    try:
+        get_pwd_context().hash("warmup")
+    except Exception as e:
+        logger.warning("Password hashing warmup failed", error=str(e))
 
 
 class AuthService:
+    __slots__ = ("db",)
+
     def __init__(self, db: Session):
         self.db = db
 
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         """Verify a password against its hash"""
-        return pwd_context.verify(plain_password, hashed_password)
+        return get_pwd_context().verify(plain_password, hashed_password)
 
     def get_password_hash(self, password: str) -> str:
         """Generate password hash"""
-        return pwd_context.hash(password)
+        return get_pwd_context().hash(password)
 
     def create_access_token(
         self, data: Dict[str, Any], expires_delta: Optional[timedelta] = None
@@ -53,8 +70,7 @@ class AuthService:
         """Create a JWT token for device authentication"""
         data = {"sub": device_id, "type": "device", "scope": "device:auth"}
 
-        expires_delta = timedelta(days=365)  # Device tokens last longer
-        return self.create_access_token(data, expires_delta)
+        return self.create_access_token(data, DEVICE_TOKEN_LIFETIME)
 
     def create_user_token(
         self, user_id: str, email: str, scopes: list = ["read", "write"]
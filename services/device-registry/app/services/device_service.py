@@ -9,33 +9,33 @@ from typing import Optional
 
 import structlog
 from sqlalchemy import and_
+from sqlalchemy import case
+from sqlalchemy import delete
+from sqlalchemy import update
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from sqlalchemy.orm import load_only
 
 from ..config import settings
 from ..models import device as device_models
 from ..schemas import device as device_schemas
+from .redis_service import RedisService
 
 logger = structlog.get_logger()
 
 
 class DeviceService:
-    def __init__(self, db: Session):
+    __slots__ = ("db", "redis_service")
+
+    def __init__(self, db: Session, redis_service: Optional[RedisService] = None):
         self.db = db
+        self.redis_service = redis_service
 
     async def create_device(
         self, device_data: device_schemas.DeviceCreate, owner_id: str
     ) -> device_models.Device:
         """Create a new device"""
-        # Check if device_id already exists
-        existing = (
-            self.db.query(device_models.Device)
-            .filter(device_models.Device.device_id == device_data.device_id)
-            .first()
-        )
-
-        if existing:
-            raise ValueError(f"Device with ID {device_data.device_id} already exists")
-
         # Generate API key if not provided
         api_key = device_data.api_key or self._generate_api_key()
 
@@ -60,8 +60,19 @@ class DeviceService:
             location_name=device_data.location_name,
         )
 
+        # Rely on the unique index on device_id instead of a pre-check query
         self.db.add(db_device)
-        self.db.commit()
+        try:
+            self.db.commit()
+        except IntegrityError as e:
+            self.db.rollback()
+            if self._is_unique_violation(e, "device_id"):
+                raise ValueError(
+                    f"Device with ID {device_data.device_id} already exists"
+                ) from e
+            if self._is_unique_violation(e, "api_key"):
+                raise ValueError("API key is already in use by another device") from e
+            raise
         self.db.refresh(db_device)
 
         logger.info(
@@ -78,13 +89,31 @@ class DeviceService:
         user_id: str,
         skip: int = 0,
         limit: int = 100,
-        status: Optional[str] = None,
+        status: Optional[device_models.DeviceStatus] = None,
+        summary: bool = False,
     ) -> List[device_models.Device]:
         """List devices for a user with optional filtering"""
         query = self.db.query(device_models.Device).filter(
             device_models.Device.owner_id == user_id
         )
 
+        # Summary listings skip wide columns like description and metadata_json
+        if summary:
+            query = query.options(
+                load_only(
+                    device_models.Device.id,
+                    device_models.Device.device_id,
+                    device_models.Device.name,
+                    device_models.Device.device_type,
+                    device_models.Device.status,
+                    device_models.Device.is_healthy,
+                    device_models.Device.last_seen,
+                    device_models.Device.owner_id,
+                    device_models.Device.created_at,
+                    device_models.Device.updated_at,
+                )
+            )
+
         if status:
             query = query.filter(device_models.Device.status == status)
 
@@ -107,12 +136,8 @@ class DeviceService:
 
     async def update_device(
         self, device_id: str, device_update: device_schemas.DeviceUpdate, owner_id: str
-    ) -> Optional[device_models.Device]:
+    ) -> Optional[Row]:
         """Update device information"""
-        db_device = await self.get_device(device_id, owner_id)
-        if not db_device:
-            return None
-
         # Update fields
         update_data = device_update.model_dump(exclude_unset=True)
 
@@ -122,13 +147,25 @@ class DeviceService:
             update_data["metadata_json"] = metadata_json
             del update_data["metadata"]
 
-        for field, value in update_data.items():
-            setattr(db_device, field, value)
-
-        db_device.updated_at = datetime.utcnow()
+        update_data["updated_at"] = datetime.utcnow()
 
+        # Single UPDATE ... RETURNING instead of SELECT, flush and refresh
+        db_device = self.db.execute(
+            update(device_models.Device)
+            .where(
+                and_(
+                    device_models.Device.device_id == device_id,
+                    device_models.Device.owner_id == owner_id,
+                )
+            )
+            .values(**update_data)
+            .returning(*device_models.Device.__table__.columns)
+            .execution_options(synchronize_session=False)
+        ).first()
         self.db.commit()
-        self.db.refresh(db_device)
+
+        if not db_device:
+            return None
 
         logger.info(
             "Device updated successfully", device_id=device_id, owner_id=owner_id
@@ -138,13 +175,22 @@ class DeviceService:
 
     async def delete_device(self, device_id: str, owner_id: str) -> bool:
         """Delete a device"""
-        db_device = await self.get_device(device_id, owner_id)
-        if not db_device:
-            return False
-
-        self.db.delete(db_device)
+        deleted_id = self.db.execute(
+            delete(device_models.Device)
+            .where(
+                and_(
+                    device_models.Device.device_id == device_id,
+                    device_models.Device.owner_id == owner_id,
+                )
+            )
+            .returning(device_models.Device.id)
+            .execution_options(synchronize_session=False)
+        ).scalar()
         self.db.commit()
 
+        if deleted_id is None:
+            return False
+
         logger.info(
             "Device deleted successfully", device_id=device_id, owner_id=owner_id
         )
@@ -168,15 +214,31 @@ class DeviceService:
         if not device:
             raise ValueError("Invalid device credentials or device not active")
 
-        # Update last seen
-        device.last_seen = datetime.utcnow()
-        self.db.commit()
+        # Update last seen, buffered in Redis and flushed in batches when available
+        if not (
+            self.redis_service and await self.redis_service.record_last_seen(device_id)
+        ):
+            device.last_seen = datetime.utcnow()
+            self.db.commit()
+
+        # Reuse the cached token while it has more than a day of life left
+        token = None
+        if self.redis_service:
+            token = await self.redis_service.get_device_token(device_id)
 
-        # Generate JWT token
-        from .auth_service import AuthService
+        if not token:
+            # Generate JWT token
+            from .auth_service import DEVICE_TOKEN_LIFETIME
+            from .auth_service import AuthService
 
-        auth_service = AuthService(self.db)
-        token = auth_service.create_device_token(device_id)
+            auth_service = AuthService(self.db)
+            token = auth_service.create_device_token(device_id)
+
+            if self.redis_service:
+                ttl = DEVICE_TOKEN_LIFETIME - timedelta(days=1)
+                await self.redis_service.cache_device_token(
+                    device_id, token, int(ttl.total_seconds())
+                )
 
         logger.info(
             "Device authenticated successfully",
@@ -186,6 +248,37 @@ class DeviceService:
 
         return token
 
+    async def flush_last_seen(self, last_seen: Dict[str, int]) -> int:
+        """Persist buffered last seen timestamps in a single UPDATE"""
+        if not last_seen:
+            return 0
+
+        timestamps = {
+            device_id: datetime.utcfromtimestamp(ts)
+            for device_id, ts in last_seen.items()
+        }
+
+        updated = self.db.scalars(
+            update(device_models.Device)
+            .where(device_models.Device.device_id.in_(list(timestamps)))
+            .values(last_seen=case(timestamps, value=device_models.Device.device_id))
+            .returning(device_models.Device.owner_id)
+            .execution_options(synchronize_session=False)
+        ).all()
+        self.db.commit()
+
+        if self.redis_service:
+            for owner_id in set(updated):
+                await self.redis_service.invalidate_devices(owner_id)
+
+        logger.info(
+            "Device last seen flushed",
+            buffered=len(timestamps),
+            updated=len(updated),
+        )
+
+        return len(updated)
+
     async def update_device_status(
         self, device_id: str, status: device_models.DeviceStatus
     ) -> bool:
@@ -207,6 +300,9 @@ class DeviceService:
 
         self.db.commit()
 
+        if self.redis_service:
+            await self.redis_service.invalidate_devices(device.owner_id)
+
         logger.info(
             "Device status updated", device_id=device_id, new_status=status.value
         )
@@ -232,6 +328,9 @@ class DeviceService:
 
         self.db.commit()
 
+        if self.redis_service:
+            await self.redis_service.invalidate_devices(device.owner_id)
+
         logger.info(
             "Device health updated",
             device_id=device_id,
@@ -253,6 +352,19 @@ class DeviceService:
             .all()
         )
 
+    @staticmethod
+    def _is_unique_violation(error: IntegrityError, column: str) -> bool:
+        """Check whether an IntegrityError is a unique violation on column"""
+        orig = error.orig
+        # Postgres reports the violated constraint, named after its column
+        if getattr(orig, "pgcode", None):
+            constraint = orig.diag.constraint_name or ""
+            return orig.pgcode == "23505" and column in constraint
+
+        # SQLite: "UNIQUE constraint failed: devices.device_id"
+        message = str(orig)
+        return message.startswith("UNIQUE") and message.endswith(f".{column}")
+
     def _generate_api_key(self) -> str:
         """Generate a secure API key"""
         return f"{settings.api_key_prefix}{secrets.token_urlsafe(32)}"
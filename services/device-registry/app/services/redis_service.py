@@ -0,0 +1,248 @@
+import time
+from typing import Dict
+from typing import Optional
+
+import redis.asyncio as redis
+import structlog
+
+from ..config import settings
+
+logger = structlog.get_logger()
+
+LAST_SEEN_KEY = "device:last_seen"
+
+# HDEL each device field only while it still holds the flushed timestamp
+_CLEAR_LAST_SEEN = """
+local cleared = 0
+for i = 1, #ARGV, 2 do
+    if redis.call("HGET", KEYS[1], ARGV[i]) == ARGV[i + 1] then
+        cleared = cleared + redis.call("HDEL", KEYS[1], ARGV[i])
+    end
+end
+return cleared
+"""
+
+
+class RedisService:
+    def __init__(self):
+        self.redis_client: Optional[redis.Redis] = None
+        self.is_connected = False
+
+    async def connect(self):
+        """
+        Connect to Redis
+        """
+        try:
+            self.redis_client = redis.from_url(
+                settings.redis_url, encoding="utf-8", decode_responses=True
+            )
+
+            # Test connection
+            await self.redis_client.ping()
+            self.is_connected = True
+            logger.info("Connected to Redis")
+
+        except Exception as e:
+            logger.error("Failed to connect to Redis", error=str(e))
+            self.is_connected = False
+            raise
+
+    async def disconnect(self):
+        """
+        Disconnect from Redis
+        """
+        if self.redis_client:
+            await self.redis_client.close()
+            self.is_connected = False
+            logger.info("Disconnected from Redis")
+
+    async def record_last_seen(self, device_id: str) -> bool:
+        """
+        Buffer a device last seen timestamp until the next flush.
+        Returns False when the timestamp could not be buffered.
+        """
+        if not self.is_connected:
+            return False
+
+        try:
+            await self.redis_client.hset(LAST_SEEN_KEY, device_id, int(time.time()))
+            return True
+
+        except Exception as e:
+            logger.error(
+                "Failed to record device last seen", device_id=device_id, error=str(e)
+            )
+            return False
+
+    async def get_last_seen(self) -> Dict[str, int]:
+        """
+        Read the buffered last seen timestamps, leaving them buffered
+        until clear_last_seen confirms they were persisted
+        """
+        if not self.is_connected:
+            return {}
+
+        try:
+            last_seen = await self.redis_client.hgetall(LAST_SEEN_KEY)
+            return {device_id: int(ts) for device_id, ts in last_seen.items()}
+
+        except Exception as e:
+            logger.error("Failed to get device last seen", error=str(e))
+            return {}
+
+    async def clear_last_seen(self, last_seen: Dict[str, int]):
+        """
+        Drop persisted last seen timestamps from the buffer. Fields recorded
+        again since they were read hold a newer value and are kept.
+        """
+        if not self.is_connected or not last_seen:
+            return
+
+        try:
+            args = [value for item in last_seen.items() for value in map(str, item)]
+            await self.redis_client.eval(_CLEAR_LAST_SEEN, 1, LAST_SEEN_KEY, *args)
+
+        except Exception as e:
+            logger.error("Failed to clear device last seen", error=str(e))
+
+    async def get_device_cache_version(self, owner_id: str) -> str:
+        """
+        Get an owner's device cache version, bumped on every write.
+        Read it before querying so a response built from stale rows is
+        cached under a version that has already been retired.
+        """
+        if not self.is_connected:
+            return "0"
+
+        try:
+            return await self.redis_client.get(f"devices:{owner_id}:version") or "0"
+
+        except Exception as e:
+            logger.error(
+                "Failed to get device cache version", owner_id=owner_id, error=str(e)
+            )
+            return "0"
+
+    async def get_cached_device(
+        self, owner_id: str, version: str, device_id: str
+    ) -> Optional[str]:
+        """
+        Get a cached device response body
+        """
+        if not self.is_connected:
+            return None
+
+        try:
+            return await self.redis_client.get(
+                f"device:{owner_id}:{version}:{device_id}"
+            )
+
+        except Exception as e:
+            logger.error(
+                "Failed to get cached device", device_id=device_id, error=str(e)
+            )
+            return None
+
+    async def cache_device(
+        self, owner_id: str, version: str, device_id: str, body: str
+    ):
+        """
+        Cache a device response body
+        """
+        if not self.is_connected:
+            return
+
+        try:
+            await self.redis_client.setex(
+                f"device:{owner_id}:{version}:{device_id}",
+                settings.device_cache_ttl,
+                body,
+            )
+
+        except Exception as e:
+            logger.error("Failed to cache device", device_id=device_id, error=str(e))
+
+    async def get_cached_device_list(
+        self, owner_id: str, version: str, query: str
+    ) -> Optional[str]:
+        """
+        Get a cached device list response body
+        """
+        if not self.is_connected:
+            return None
+
+        try:
+            return await self.redis_client.get(f"devices:{owner_id}:{version}:{query}")
+
+        except Exception as e:
+            logger.error(
+                "Failed to get cached device list", owner_id=owner_id, error=str(e)
+            )
+            return None
+
+    async def cache_device_list(
+        self, owner_id: str, version: str, query: str, body: str
+    ):
+        """
+        Cache a device list response body, each page expires on its own
+        """
+        if not self.is_connected:
+            return
+
+        try:
+            await self.redis_client.setex(
+                f"devices:{owner_id}:{version}:{query}",
+                settings.device_cache_ttl,
+                body,
+            )
+
+        except Exception as e:
+            logger.error("Failed to cache device list", owner_id=owner_id, error=str(e))
+
+    async def invalidate_devices(self, owner_id: str):
+        """
+        Drop cached responses for an owner after a write. Bumping the cache
+        version retires every cached device and page at once, old entries
+        just expire.
+        """
+        if not self.is_connected:
+            return
+
+        try:
+            await self.redis_client.incr(f"devices:{owner_id}:version")
+
+        except Exception as e:
+            logger.error(
+                "Failed to invalidate device cache", owner_id=owner_id, error=str(e)
+            )
+
+    async def get_device_token(self, device_id: str) -> Optional[str]:
+        """
+        Get a cached device JWT
+        """
+        if not self.is_connected:
+            return None
+
+        try:
+            return await self.redis_client.get(f"devtok:{device_id}")
+
+        except Exception as e:
+            logger.error(
+                "Failed to get cached device token", device_id=device_id, error=str(e)
+            )
+            return None
+
+    async def cache_device_token(self, device_id: str, token: str, ttl: int):
+        """
+        Cache a device JWT, ttl should end before the token expires
+        """
+        if not self.is_connected:
+            return
+
+        try:
+            await self.redis_client.setex(f"devtok:{device_id}", ttl, token)
+
+        except Exception as e:
+            logger.error(
+                "Failed to cache device token", device_id=device_id, error=str(e)
+            )
@@ -0,0 +1,27 @@
+"""
+Device Registry Test Factories
+Build model rows that are flushed into the test session instead of committed
+"""
+
+import factory
+from factory.alchemy import SQLAlchemyModelFactory
+
+from app.config import settings
+from app.models.device import Device
+from app.models.device import DeviceType
+
+
+class DeviceFactory(SQLAlchemyModelFactory):
+    """Device rows with the required columns filled in"""
+
+    class Meta:
+        model = Device
+        sqlalchemy_session_persistence = "flush"
+
+    device_id = factory.Sequence(lambda n: f"factory-device-{n:03d}")
+    name = factory.LazyAttribute(lambda device: f"Device {device.device_id}")
+    device_type = DeviceType.SENSOR
+    api_key = factory.LazyAttribute(
+        lambda device: f"{settings.api_key_prefix}{device.device_id}"
+    )
+    owner_id = "test-owner"
@@ -0,0 +1,107 @@
+"""
+Unit Tests for the Redis response cache and last seen buffer
+"""
+
+import pytest
+
+from app.services.redis_service import LAST_SEEN_KEY
+
+
+class TestDeviceCache:
+    """Test versioned device detail and list caching"""
+
+    async def test_cache_device_round_trip(self, fake_redis_service):
+        """Test a cached device body is served under the current version"""
+        version = await fake_redis_service.get_device_cache_version("owner-1")
+        await fake_redis_service.cache_device("owner-1", version, "dev-1", '{"a":1}')
+
+        cached = await fake_redis_service.get_cached_device("owner-1", version, "dev-1")
+        assert cached == '{"a":1}'
+
+    async def test_cache_device_list_expires(self, fake_redis_service):
+        """Test each list page is its own key with the cache TTL"""
+        version = await fake_redis_service.get_device_cache_version("owner-1")
+        await fake_redis_service.cache_device_list("owner-1", version, "0:2", "[1]")
+        await fake_redis_service.cache_device_list("owner-1", version, "2:2", "[2]")
+
+        client = fake_redis_service.redis_client
+        assert await client.ttl(f"devices:owner-1:{version}:0:2") > 0
+        assert await client.ttl(f"devices:owner-1:{version}:2:2") > 0
+        assert (
+            await fake_redis_service.get_cached_device_list("owner-1", version, "2:2")
+            == "[2]"
+        )
+
+    async def test_invalidate_retires_owner_entries(self, fake_redis_service):
+        """Test invalidation hides the owner's cached devices and pages"""
+        old = await fake_redis_service.get_device_cache_version("owner-1")
+        other = await fake_redis_service.get_device_cache_version("owner-2")
+        await fake_redis_service.cache_device("owner-1", old, "dev-1", "{}")
+        await fake_redis_service.cache_device_list("owner-1", old, "0:100", "[]")
+        await fake_redis_service.cache_device("owner-2", other, "dev-2", "{}")
+
+        await fake_redis_service.invalidate_devices("owner-1")
+
+        new = await fake_redis_service.get_device_cache_version("owner-1")
+        assert new != old
+        assert (
+            await fake_redis_service.get_cached_device("owner-1", new, "dev-1") is None
+        )
+        assert (
+            await fake_redis_service.get_cached_device_list("owner-1", new, "0:100")
+            is None
+        )
+        # Other owners keep their entries
+        assert await fake_redis_service.get_device_cache_version("owner-2") == other
+        assert (
+            await fake_redis_service.get_cached_device("owner-2", other, "dev-2")
+            == "{}"
+        )
+
+    async def test_disconnected_service_skips_redis(self, fake_redis_service):
+        """Test every call short-circuits while disconnected"""
+        fake_redis_service.is_connected = False
+
+        await fake_redis_service.cache_device("owner-1", "0", "dev-1", "{}")
+        assert await fake_redis_service.get_device_cache_version("owner-1") == "0"
+        assert (
+            await fake_redis_service.get_cached_device("owner-1", "0", "dev-1") is None
+        )
+        assert await fake_redis_service.redis_client.dbsize() == 0
+
+
+class TestLastSeenBuffer:
+    """Test buffering and clearing device last seen timestamps"""
+
+    async def test_record_and_get_last_seen(self, fake_redis_service):
+        """Test recorded timestamps are read back without being cleared"""
+        assert await fake_redis_service.record_last_seen("dev-1")
+        assert await fake_redis_service.record_last_seen("dev-2")
+
+        last_seen = await fake_redis_service.get_last_seen()
+
+        assert set(last_seen) == {"dev-1", "dev-2"}
+        assert all(isinstance(ts, int) for ts in last_seen.values())
+        assert await fake_redis_service.get_last_seen() == last_seen
+
+    async def test_clear_last_seen_keeps_newer_timestamps(self, fake_redis_service):
+        """Test clearing drops flushed entries but keeps ones seen since"""
+        client = fake_redis_service.redis_client
+        await client.hset(LAST_SEEN_KEY, mapping={"dev-1": 100, "dev-2": 100})
+        flushed = await fake_redis_service.get_last_seen()
+
+        # dev-2 checks in again between the read and the clear
+        await client.hset(LAST_SEEN_KEY, "dev-2", 200)
+        await fake_redis_service.clear_last_seen(flushed)
+
+        assert await client.hgetall(LAST_SEEN_KEY) == {"dev-2": "200"}
+
+    @pytest.mark.parametrize("last_seen", [{}, {"dev-1": 100}])
+    async def test_clear_last_seen_without_matches(self, fake_redis_service, last_seen):
+        """Test clearing entries that are not buffered is a no-op"""
+        client = fake_redis_service.redis_client
+        await client.hset(LAST_SEEN_KEY, "dev-2", 100)
+
+        await fake_redis_service.clear_last_seen(last_seen)
+
+        assert await client.hgetall(LAST_SEEN_KEY) == {"dev-2": "100"}